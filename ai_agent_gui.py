@@ -1,24 +1,62 @@
 import sys
-from PySide6.QtCore import QAbstractListModel, QMargins, QPoint, Qt, QTimer
-from PySide6.QtGui import QColor, QFontMetrics, QIcon, QFont
+from PySide6.QtCore import (
+    QAbstractListModel, QAbstractTableModel, QMargins, QModelIndex, QObject, QPoint,
+    QRect, QSize, Qt, QTimer, Signal
+)
+from PySide6.QtGui import QColor, QFontMetrics, QIcon, QFont, QPixmap
 from PySide6.QtWidgets import (
     QApplication, QLineEdit, QListView, QMainWindow, QPushButton,
     QVBoxLayout, QHBoxLayout, QWidget, QFileDialog, QStyledItemDelegate, 
     QListWidget, QStackedWidget, QLabel, QDialogButtonBox, 
-    QDialog, QMessageBox
+    QDialog, QMessageBox, QTableView, QCheckBox
 )
 from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
 from langchain_openai import ChatOpenAI
 from langchain.agents.agent_types import AgentType
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_experimental.tools.python.tool import PythonAstREPLTool, sanitize_input
 import pandas as pd
+import numpy as np
 import matplotlib
+import tiktoken
+import io
 from pinecone import Pinecone
+from pinecone.exceptions import PineconeApiException
 from dotenv import load_dotenv
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import HTTPError as TransportError
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from collections import deque
+from email.utils import parsedate_to_datetime
+import ast
+import hashlib
+import json
+import keyword
+import random
+import re
+import statistics
+import socket
+import sqlite3
+import threading
+import time
 import uuid
+from typing import Any
+from urllib.parse import urlsplit
+
+# Plots are rasterized into the chat instead of opening their own windows.
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
 
-matplotlib.use('QT5Agg')
+# The agent works on shallow copies of the loaded frames, copy-on-write keeps
+# its in-place changes out of the shared tables. Always on from pandas 3.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
 USER_ME = 0
 USER_THEM = 1
@@ -28,8 +66,145 @@ BUBBLE_COLORS = {USER_ME: "#90caf9", USER_THEM: "#a5d6a7"}
 BUBBLE_PADDING = QMargins(15, 5, 15, 5)
 TEXT_PADDING = QMargins(25, 15, 25, 15)
 
+TABLE_VIEW_HEIGHT = 220
+TABLE_PAGE_SIZE = 200
+THUMBNAIL_WIDTH = 420
+
 NAMESPACE_ID = None
 
+# A DataFrame returned by the agent, shown in a table view inside the chat.
+class TableResult:
+    def __init__(self, df):
+        self.df = df
+
+    @property
+    def caption(self):
+        return f"{len(self.df):,} rows x {len(self.df.columns)} columns"
+
+
+# A plot produced by the agent, rasterized to a PNG thumbnail off the UI thread.
+class ChartResult:
+    def __init__(self, png, width, height):
+        self.png = png
+        self.width = width
+        self.height = height
+        self._pixmap = None
+
+    @property
+    def pixmap(self):
+        # Decode once, then reuse for every repaint.
+        if self._pixmap is None:
+            self._pixmap = QPixmap()
+            self._pixmap.loadFromData(self.png, "PNG")
+        return self._pixmap
+
+
+def render_chart(figure):
+    dpi = THUMBNAIL_WIDTH / figure.get_figwidth()
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png", dpi=dpi)
+    width, height = figure.get_size_inches() * dpi
+    return ChartResult(buffer.getvalue(), int(width), int(height))
+
+
+PLOT_NAMES = {"plt", "matplotlib", "pyplot", "sns", "seaborn"}
+PLOT_ATTRIBUTES = {"plot", "hist", "boxplot", "scatter", "bar", "barh", "pie", "area", "kde", "density",
+                   "imshow", "figure", "subplots", "show", "savefig"}
+
+
+def parse_code(code):
+    try:
+        return ast.parse(sanitize_input(code))
+    except SyntaxError:
+        return None
+
+
+def may_plot(code):
+    tree = parse_code(code)
+    if tree is None:
+        return True
+    return any(
+        isinstance(node, ast.Name) and node.id in PLOT_NAMES
+        or isinstance(node, ast.Attribute) and node.attr in PLOT_ATTRIBUTES
+        for node in ast.walk(tree)
+    )
+
+
+# Pyplot keeps one global set of figures and a global current figure, so code
+# that may plot runs one call at a time. The figures a call opens are
+# rasterized into charts (or dropped) and closed before the next call starts,
+# so runs never see each other's plots. Other code runs without the lock.
+_pyplot_lock = threading.RLock()
+
+
+@contextmanager
+def capture_figures(plots, charts=None):
+    if not plots:
+        yield
+        return
+
+    with _pyplot_lock:
+        figures = set(plt.get_fignums())
+        try:
+            yield
+        finally:
+            for number in sorted(set(plt.get_fignums()) - figures):
+                if charts is not None:
+                    charts.append(render_chart(plt.figure(number)))
+                plt.close(number)
+
+
+# Serves a DataFrame to a QTableView one page of rows at a time. Cells are only
+# formatted when the view asks for them, i.e. when they are visible.
+class DataFrameModel(QAbstractTableModel):
+    def __init__(self, df, parent=None):
+        super().__init__(parent)
+        self.df = df
+        self._loaded = min(TABLE_PAGE_SIZE, len(df))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.df.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole:
+            value = self.df.iat[index.row(), index.column()]
+            if pd.api.types.is_scalar(value) and pd.isna(value):
+                return ""
+            return str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole:
+            if orientation == Qt.Horizontal:
+                return str(self.df.columns[section])
+            return str(self.df.index[section])
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self._loaded < len(self.df)
+
+    def fetchMore(self, parent):
+        count = min(TABLE_PAGE_SIZE, len(self.df) - self._loaded)
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
+
+def create_table_widget(result):
+    container = QWidget()
+    layout = QVBoxLayout(container)
+    caption_height = QFontMetrics(container.font()).height()
+    layout.setContentsMargins(TEXT_PADDING.left(), TEXT_PADDING.top() + caption_height,
+                              TEXT_PADDING.right(), TEXT_PADDING.bottom())
+
+    view = QTableView(container)
+    view.setModel(DataFrameModel(result.df, view))
+    view.verticalHeader().setDefaultSectionSize(caption_height + 6)
+    layout.addWidget(view)
+    return container
+
+
 # Draws each message.
 class MessageDelegate(QStyledItemDelegate):
 
@@ -61,6 +236,12 @@ class MessageDelegate(QStyledItemDelegate):
         if isinstance(text, str):
             painter.setPen(Qt.black)
             painter.drawText(textrect, Qt.TextWordWrap, text)
+        elif isinstance(text, ChartResult):
+            painter.drawPixmap(textrect.topLeft(), text.pixmap)
+        elif isinstance(text, TableResult):
+            # The table itself is an index widget laid over the bubble.
+            painter.setPen(Qt.black)
+            painter.drawText(textrect, Qt.AlignLeft | Qt.AlignTop, text.caption)
 
     def sizeHint(self, option, index):
         _, text = index.model().data(index, Qt.DisplayRole)
@@ -69,6 +250,10 @@ class MessageDelegate(QStyledItemDelegate):
         rect = option.rect.marginsRemoved(TEXT_PADDING)
         if isinstance(text, str):
             rect = metrics.boundingRect(rect, Qt.TextWordWrap, text)
+        elif isinstance(text, ChartResult):
+            rect = QRect(rect.topLeft(), QSize(text.width, text.height))
+        elif isinstance(text, TableResult):
+            rect = QRect(rect.topLeft(), QSize(rect.width(), metrics.height() + TABLE_VIEW_HEIGHT))
         rect = rect.marginsAdded(TEXT_PADDING)  # Re-add padding for item size.
         return rect.size()
 
@@ -88,18 +273,1147 @@ class MessageModel(QAbstractListModel):
 
     def add_message(self, who, text):
         if text:  # Don't add empty strings.
-            # Access the list via the model.
+            # Access the list via the model, announcing the new row so index
+            # widgets on earlier rows stay in place.
+            row = len(self.messages)
+            self.beginInsertRows(QModelIndex(), row, row)
             self.messages.append((who, text))
-            # Trigger refresh.
-            self.layoutChanged.emit()
+            self.endInsertRows()
+
+    def update_message(self, row, who, text):
+        self.messages[row] = (who, text)
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+
+class RequestCancelled(Exception):
+    pass
+
+
+# The cancel token of the request running on the current worker thread.
+_request_context = threading.local()
+
+
+@contextmanager
+def cancellable(token):
+    previous = getattr(_request_context, "token", None)
+    _request_context.token = token
+    try:
+        yield token
+    finally:
+        _request_context.token = previous
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._children = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise RequestCancelled("Request cancelled.")
+
+    def wait(self, seconds):
+        # Sleeps for the given time, returning early with an error on cancel.
+        self._event.wait(seconds)
+        self.check()
+
+    def spawn(self):
+        # Child tokens are cancelled together with their parent.
+        child = CancelToken()
+        with self._lock:
+            self._children.append(child)
+        if self.cancelled:
+            child.cancel()
+        return child
+
+    def attach(self, conn):
+        with self._lock:
+            self._connections.add(conn)
+        if self.cancelled:
+            self._abort(conn)
+
+    def detach(self, conn):
+        with self._lock:
+            self._connections.discard(conn)
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            connections = list(self._connections)
+            children = list(self._children)
+        for conn in connections:
+            self._abort(conn)
+        for child in children:
+            child.cancel()
+
+    @staticmethod
+    def _abort(conn):
+        # Shutting the socket down wakes up the worker blocked on the response.
+        sock = getattr(conn, "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+# Connection pools that register every checked out connection with the cancel
+# token of the calling thread, so cancelling a request closes its connection.
+class _TrackedPoolMixin:
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        token = getattr(_request_context, "token", None)
+        if token is not None:
+            token.attach(conn)
+        return conn
+
+    def _put_conn(self, conn):
+        token = getattr(_request_context, "token", None)
+        if token is not None and conn is not None:
+            token.detach(conn)
+        super()._put_conn(conn)
+
+
+class _TrackedHTTPConnectionPool(_TrackedPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _TrackedHTTPSConnectionPool(_TrackedPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class CancellableAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TrackedHTTPConnectionPool,
+            "https": _TrackedHTTPSConnectionPool,
+        }
+
+
+def create_session():
+    session = requests.Session()
+    adapter = CancellableAdapter(pool_maxsize=8)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+HTTP_SESSION = create_session()
+
+
+# Statuses worth retrying: rate limiting and a flaky proxy or backend.
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# Hedge a prediction once it has been running longer than this percentile.
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=8.0, max_retry_after=30.0,
+                 retry_statuses=RETRY_STATUSES, retry_on=(requests.ConnectionError, requests.Timeout)):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.retry_statuses = retry_statuses
+        self.retry_on = retry_on
+
+    def should_retry_error(self, error):
+        if not isinstance(error, self.retry_on):
+            return False
+        # Client SDKs (Pinecone) attach the status to their exceptions.
+        status = getattr(error, "status", None)
+        return not isinstance(status, int) or status in self.retry_statuses or status >= 500
+
+    def delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        # Exponential backoff with full jitter.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self, name):
+        with self._lock:
+            state = self._state()
+            if state == self.OPEN or (state == self.HALF_OPEN and self._probing):
+                retry_in = self.reset_timeout - (time.monotonic() - self._opened_at)
+                raise CircuitOpenError(f"{name} is unavailable, retrying in {max(0, int(retry_in))}s.")
+            # Let a single probe through once the reset timeout has passed.
+            self._probing = state == self.HALF_OPEN
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def record_abandoned(self):
+        # The call ended without saying anything about the backend's health,
+        # e.g. it was cancelled, so let the next call probe again.
+        with self._lock:
+            self._probing = False
+
+
+class LatencyTracker:
+    def __init__(self, size=200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=size)
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent, min_samples=1):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        position = round(percent / 100 * (len(samples) - 1))
+        return samples[position]
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def record(self, name, value):
+        with self._lock:
+            series = self._series.setdefault(name, LatencyTracker())
+        series.record(value)
+        print(f"[metrics] {name}={value:.3f}")
+
+
+METRICS = Metrics()
+
+
+class Endpoint:
+    def __init__(self, name, policy, breaker=None):
+        self.name = name
+        self.policy = policy
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = LatencyTracker()
+
+
+ENDPOINTS = {
+    "flowise-predict": Endpoint("Flowise", RetryPolicy()),
+    "flowise-upsert": Endpoint("Flowise Upsert", RetryPolicy(max_attempts=3, base_delay=1.0)),
+    # API errors carry their status, transport errors from the SDK's urllib3 pool don't
+    "pinecone": Endpoint("Pinecone", RetryPolicy(retry_on=(PineconeApiException, TransportError))),
+}
+
+_hedge_executor = ThreadPoolExecutor(max_workers=4)
+
+
+def _backoff(seconds):
+    token = getattr(_request_context, "token", None)
+    if token is not None:
+        token.wait(seconds)
+    else:
+        time.sleep(seconds)
+
+
+# Calls send() with the endpoint's retry policy behind its circuit breaker.
+# send() returns a requests response or the result of a client SDK call.
+def call_endpoint(name, send):
+    endpoint = ENDPOINTS[name]
+    policy = endpoint.policy
+    token = getattr(_request_context, "token", None)
+
+    for attempt in range(policy.max_attempts):
+        last_attempt = attempt == policy.max_attempts - 1
+        endpoint.breaker.before_call(endpoint.name)
+        started = time.monotonic()
+        try:
+            response = send()
+        except Exception as e:
+            if token is not None and token.cancelled:
+                endpoint.breaker.record_abandoned()
+                raise RequestCancelled("Request cancelled.") from e
+            if not policy.should_retry_error(e):
+                endpoint.breaker.record_abandoned()
+                raise
+            endpoint.breaker.record_failure()
+            if last_attempt:
+                raise
+            _backoff(policy.delay(attempt))
+            continue
+
+        status = getattr(response, "status_code", None)
+        if status is not None and (status in policy.retry_statuses or status >= 500):
+            endpoint.breaker.record_failure()
+            if last_attempt or status not in policy.retry_statuses:
+                return response
+            _backoff(policy.delay(attempt, parse_retry_after(response.headers.get("Retry-After"))))
+            continue
+
+        endpoint.breaker.record_success()
+        endpoint.latencies.record(time.monotonic() - started)
+        return response
+
+
+def hedging_enabled():
+    return os.getenv("HEDGE_PREDICTIONS", "").lower() in ("1", "true", "yes")
+
+
+# Like call_endpoint, but once the call outlives the endpoint's latency
+# percentile a second identical request is raced against it. Only use this for
+# idempotent calls.
+def call_hedged(name, send):
+    endpoint = ENDPOINTS[name]
+    threshold = endpoint.latencies.percentile(HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES)
+    parent = getattr(_request_context, "token", None)
+    if not hedging_enabled() or threshold is None or parent is None:
+        return call_endpoint(name, send)
+
+    def attempt(token):
+        with cancellable(token):
+            return call_endpoint(name, send)
+
+    primary = parent.spawn()
+    futures = {_hedge_executor.submit(attempt, primary): primary}
+    done, _ = wait(futures, timeout=threshold)
+    if not done:
+        hedge = parent.spawn()
+        futures[_hedge_executor.submit(attempt, hedge)] = hedge
+
+    error = None
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                # First answer wins, abandon the other request.
+                for other in pending:
+                    futures[other].cancel()
+                return future.result()
+            error = future.exception()
+    parent.check()
+    raise error
+
+
+# Stops the agent loop between LLM calls and tool runs once cancelled.
+class CancelCallbackHandler(BaseCallbackHandler):
+    raise_error = True
+
+    def __init__(self, token):
+        self.token = token
+
+    def on_llm_start(self, *args, **kwargs):
+        self.token.check()
+
+    def on_chat_model_start(self, *args, **kwargs):
+        self.token.check()
+
+    def on_tool_start(self, *args, **kwargs):
+        self.token.check()
+
+    def on_agent_action(self, *args, **kwargs):
+        self.token.check()
+
+
+# Runs requests off the UI thread. Requests are keyed by
+# (target, namespace or dataframe fingerprint, question); submitting a key that
+# is already in flight attaches to the running request instead of issuing a new
+# call. Callbacks are invoked on the UI thread as callback(result, error).
+class RequestRegistry(QObject):
+    _finished = Signal(object, object)
+
+    def __init__(self, max_workers=4, parent=None):
+        super().__init__(parent)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._inflight = {}
+        self._finished.connect(self._deliver)
+
+    def submit(self, key, fn, callback):
+        entry = self._inflight.get(key)
+        if entry is not None:
+            entry["callbacks"].append(callback)
+            return False
+
+        token = CancelToken()
+        entry = {"token": token, "callbacks": [callback]}
+        self._inflight[key] = entry
+        future = self._executor.submit(self._run, fn, token)
+        future.add_done_callback(lambda f: self._finished.emit(key, (entry, f)))
+        return True
+
+    def _run(self, fn, token):
+        with cancellable(token):
+            token.check()
+            return fn(token)
+
+    def _deliver(self, key, payload):
+        entry, future = payload
+        if self._inflight.get(key) is not entry:
+            return  # Already delivered as cancelled.
+        del self._inflight[key]
+
+        error = future.exception()
+        result = None if error else future.result()
+        if entry["token"].cancelled:
+            result, error = None, RequestCancelled("Request cancelled.")
+        for callback in entry["callbacks"]:
+            callback(result, error)
+
+    def cancel(self, key):
+        entry = self._inflight.pop(key, None)
+        if entry is None:
+            return
+        entry["token"].cancel()
+        # Report the cancellation right away, the worker may still be unwinding.
+        for callback in entry["callbacks"]:
+            callback(None, RequestCancelled("Request cancelled."))
+
+    def cancel_target(self, target):
+        for key in [key for key in self._inflight if key[0] == target]:
+            self.cancel(key)
+
+    def has_pending(self, target):
+        return any(key[0] == target for key in self._inflight)
+
+    def is_pending(self, key):
+        return key in self._inflight
+
+    def shutdown(self):
+        for key in list(self._inflight):
+            self._inflight.pop(key)["token"].cancel()
+        self._executor.shutdown(wait=False)
+
+
+_request_registry = None
+
+
+def request_registry():
+    global _request_registry
+    if _request_registry is None:
+        _request_registry = RequestRegistry()
+    return _request_registry
+
+
+def dataframe_fingerprint(df):
+    digest = hashlib.sha1()
+    digest.update(repr(list(df.columns)).encode())
+    digest.update(repr([str(dtype) for dtype in df.dtypes]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+LLM_CACHE_MAX_ENTRIES = 2000
+TOOL_CACHE_MAX_ENTRIES = 5000
+
+
+def cache_key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+# A string key/value store in SQLite that evicts the least recently used
+# entries beyond max_entries and counts its hits and misses.
+class PersistentLRUCache:
+    def __init__(self, path, name, max_entries):
+        self.name = name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {name} (key TEXT PRIMARY KEY, value TEXT, used REAL)")
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_used ON {name} (used)")
+
+    def get(self, key):
+        with self._lock, self._conn:
+            row = self._conn.execute(f"SELECT value FROM {self.name} WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute(f"UPDATE {self.name} SET used = ? WHERE key = ?", (time.time(), key))
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row[0] if row is not None else None
+
+    def put(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(f"INSERT OR REPLACE INTO {self.name} VALUES (?, ?, ?)", (key, value, time.time()))
+            self._conn.execute(
+                f"DELETE FROM {self.name} WHERE key IN "
+                f"(SELECT key FROM {self.name} ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.name}")
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+
+# First level: LLM completions keyed by prompt and model settings.
+class LLMCache(BaseCache):
+    def __init__(self, store):
+        self.store = store
+
+    def lookup(self, prompt, llm_string):
+        value = self.store.get(cache_key(prompt, llm_string))
+        if value is None:
+            return None
+        return [loads(generation) for generation in json.loads(value)]
+
+    def update(self, prompt, llm_string, return_val):
+        value = json.dumps([dumps(generation) for generation in return_val])
+        self.store.put(cache_key(prompt, llm_string), value)
+
+    def clear(self, **kwargs):
+        self.store.clear()
+
+
+# Second level: the agent's python tool, keyed by the generated code and the
+# fingerprint of the dataframes it runs against, taken when they were loaded.
+SIDE_EFFECT_METHODS = {"insert", "pop", "update", "append", "extend", "clear", "remove", "sort", "setdefault",
+                       "popitem", "to_csv", "to_excel", "to_json", "to_parquet", "to_pickle", "to_sql"}
+SIDE_EFFECT_FUNCTIONS = {"exec", "eval", "setattr", "delattr", "globals", "locals", "vars", "open", "__import__"}
+BINDING_NODES = (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Global,
+                 ast.Nonlocal, ast.NamedExpr)
+
+
+# Code that doesn't bind names, assign into objects, pass inplace= or call a
+# mutating method leaves the locals as they were, so its output can be
+# replayed.
+def is_pure(code):
+    tree = parse_code(code)
+    if tree is None:
+        return False
+    # Comprehension variables are local to the comprehension
+    scoped = {id(node) for comprehension in ast.walk(tree) if isinstance(comprehension, ast.comprehension)
+              for node in ast.walk(comprehension.target)}
+    for node in ast.walk(tree):
+        if isinstance(node, BINDING_NODES) or isinstance(node, ast.ExceptHandler) and node.name:
+            return False
+        if isinstance(getattr(node, "ctx", None), (ast.Store, ast.Del)) and id(node) not in scoped:
+            return False
+        if isinstance(node, ast.Call):
+            function = node.func
+            if isinstance(function, ast.Attribute) and function.attr in SIDE_EFFECT_METHODS:
+                return False
+            if isinstance(function, ast.Name) and function.id in SIDE_EFFECT_FUNCTIONS:
+                return False
+            for argument in node.keywords:
+                if argument.arg == "inplace" and not (isinstance(argument.value, ast.Constant) and argument.value.value is False):
+                    return False
+    return True
+
+
+# Each run works on shallow copies of the loaded frames, a table exposed under
+# several names stays one frame.
+def frame_copies(tool_locals):
+    copies = {}
+    for value in tool_locals.values():
+        if isinstance(value, pd.DataFrame) and id(value) not in copies:
+            copies[id(value)] = value.copy(deep=False)
+    return {name: copies.get(id(value), value) for name, value in tool_locals.items()}
+
+
+class CachedPythonAstREPLTool(PythonAstREPLTool):
+    store: Any = None
+    fingerprint: str = ""
+    charts: list = []
+    names: set = set()
+    pristine: bool = True
+
+    def _run(self, query, run_manager=None):
+        if not self.names:
+            self.names = set(self.locals)
+        # Replays are only valid while the frames are as loaded and no other
+        # names are bound, once code has changed either the rest of the run is
+        # uncached.
+        pure = is_pure(query)
+        cacheable = pure and self.pristine and set(self.locals) <= self.names
+        key = cache_key(self.fingerprint, query)
+        if cacheable:
+            cached = self.store.get(key)
+            if cached is not None:
+                return cached
+
+        charts = len(self.charts)
+        with capture_figures(may_plot(query), self.charts):
+            output = str(super()._run(query, run_manager))
+
+        if not pure:
+            self.pristine = False
+        # Plots aren't replayed, so code that drew one isn't cached either.
+        elif cacheable and set(self.locals) <= self.names and len(self.charts) == charts:
+            self.store.put(key, output)
+        return output
+
+
+# Only shared columns with one of these names can be join keys.
+KEY_COLUMN_PATTERN = re.compile(r"(^|_)(id|key|code|sku)$", re.IGNORECASE)
+
+RESERVED_TABLE_NAMES = {"df", "pd", "np", "plt", "indexed_merge", "result_df"}
+
+
+def table_name(file_path):
+    name = re.sub(r"\W+", "_", os.path.splitext(os.path.basename(file_path))[0]).strip("_").lower()
+    if not name.isidentifier() or keyword.iskeyword(name) or name in RESERVED_TABLE_NAMES or re.match(r"df\d+$", name):
+        name = f"t_{name}"
+    return name
+
+
+# Join structures for a set of tables, built when they are loaded. For a shared
+# key column that is unique in one table, the row position of every key of the
+# other table is looked up ahead of time, so a join is just a gather.
+#
+# Frames are recognized by the buffer of their key column rather than by
+# identity. The agent works on shallow copies that share it, and under
+# copy-on-write any write to or reordering of the keys moves it, so a frame
+# whose key buffer still matches has exactly the keys the index was built on.
+class JoinIndex:
+    def __init__(self, tables):
+        self._tables = tables  # Keeps the buffers below from being reused.
+        self.buffers = {}
+        self.positions = {}
+        self.joins = []
+
+        names = list(tables)
+        for i, a in enumerate(names):
+            for b in names[i + 1:]:
+                for column in tables[a].columns.intersection(tables[b].columns):
+                    if self._is_key(tables[a][column], tables[b][column]):
+                        self._index(tables, a, b, column)
+
+    @staticmethod
+    def _is_key(a, b):
+        # Shared columns like name or date aren't keys even when unique. Keys
+        # must live in a numpy buffer, Arrow-backed columns are copied by
+        # to_numpy() and couldn't be recognized.
+        return (bool(KEY_COLUMN_PATTERN.search(str(a.name))) and a.dtype == b.dtype
+                and isinstance(a.dtype, np.dtype) and (a.is_unique or b.is_unique))
+
+    @staticmethod
+    def _buffer(keys):
+        values = keys.to_numpy()
+        return values.__array_interface__["data"][0], values.strides, len(values)
+
+    def _index(self, tables, a, b, column):
+        for name in (a, b):
+            self.buffers.setdefault((name, column), self._buffer(tables[name][column]))
+        for left, right in ((a, b), (b, a)):
+            if tables[right][column].is_unique:
+                lookup = pd.Index(tables[right][column])
+                self.positions[(left, right, column)] = lookup.get_indexer(tables[left][column])
+                self.joins.append(f"{left}.{column} -> {right}.{column}")
+
+    def _name(self, df, column):
+        if column not in df.columns or not df.columns.is_unique:
+            return None
+        buffer = self._buffer(df[column])
+        return next((name for (name, key), indexed in self.buffers.items() if key == column and indexed == buffer), None)
+
+    def merge(self, left, right, on, how="inner", suffixes=("_x", "_y")):
+        if how in ("inner", "left") and isinstance(on, str):
+            positions = self.positions.get((self._name(left, on), self._name(right, on), on))
+            if positions is not None:
+                return self._gather(left, right, on, positions, how, suffixes)
+
+        # Filtered, derived or changed frames have no usable index.
+        return left.merge(right, on=on, how=how, suffixes=suffixes)
+
+    @staticmethod
+    def _gather(left, right, on, positions, how, suffixes):
+        if how == "inner":
+            rows = np.flatnonzero(positions >= 0)
+            left, positions = left.take(rows), positions[rows]
+
+        right_columns = right.columns.drop(on)
+        overlap = left.columns.intersection(right_columns)
+        left_rows = left.reset_index(drop=True).rename(columns={column: f"{column}{suffixes[0]}" for column in overlap})
+        # Unmatched keys (-1) get missing values, as in a left merge
+        right_rows = pd.DataFrame({
+            f"{column}{suffixes[1]}" if column in overlap else column:
+                pd.api.extensions.take(right[column].array, positions, allow_fill=True)
+            for column in right_columns
+        }, copy=False)
+        return pd.concat([left_rows, right_rows], axis=1)
+
+
+# The named dataframes loaded into the Pandas UI. Loading more CSVs creates a
+# new TableSet, so requests in flight keep the tables they were sent with.
+class TableSet:
+    def __init__(self, tables=None, fingerprints=None):
+        self.tables = dict(tables or {})
+        self.fingerprints = dict(fingerprints or {})
+        self.join_index = JoinIndex(self.tables) if len(self.tables) > 1 else None
+        self.fingerprint = None
+        if self.tables:
+            self.fingerprint = cache_key(*(f"{name}:{self.fingerprints[name]}" for name in sorted(self.tables)))
+
+    def with_tables(self, tables):
+        fingerprints = {name: dataframe_fingerprint(df) for name, df in tables.items()}
+        return TableSet({**self.tables, **tables}, {**self.fingerprints, **fingerprints})
+
+    @property
+    def single(self):
+        return next(iter(self.tables.values())) if len(self.tables) == 1 else None
+
+    @property
+    def frames(self):
+        # One table keeps the agent's usual df name, several become df1, df2, ...
+        return self.single if self.single is not None else list(self.tables.values())
+
+    def agent_locals(self):
+        if self.join_index is None:
+            return {}
+        return {**self.tables, "indexed_merge": self.join_index.merge}
+
+    def describe(self):
+        if self.join_index is None:
+            return ""
+        aliases = ", ".join(f"{name} (df{i})" for i, name in enumerate(self.tables, 1))
+        text = f"The dataframes are also available by name: {aliases}."
+        if self.join_index.joins:
+            text += (
+                " To join them call indexed_merge(left, right, on=column, how='inner' or 'left') on the named"
+                f" dataframes instead of pd.merge, it uses precomputed indexes for: {', '.join(self.join_index.joins)}."
+            )
+        return text
+
+
+def use_cached_tools(agent, store, fingerprint):
+    tool = agent.tools[0]
+    agent.tools = [CachedPythonAstREPLTool(locals=frame_copies(tool.locals), globals=tool.globals, store=store,
+                                           fingerprint=fingerprint)]
+    return agent
+
+
+# Progressive answers: on large frames the agent first works on a stratified
+# sample, then the code it generated is rerun on the full frame.
+PROGRESSIVE_MIN_ROWS = 200_000
+PROGRESSIVE_SAMPLE_ROWS = 50_000
+PROGRESSIVE_MAX_STRATA = 50
+PROGRESSIVE_BOOTSTRAP = 5
+
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?")
+
+
+def stratified_sample(df, rows=PROGRESSIVE_SAMPLE_ROWS):
+    fraction = min(1.0, rows / len(df))
+    head = df.head(10_000)
+    cardinality = {
+        column: head[column].nunique() for column in df.columns
+        if pd.api.types.is_object_dtype(df[column]) or pd.api.types.is_string_dtype(df[column])
+        or isinstance(df[column].dtype, pd.CategoricalDtype)
+    }
+    strata = [column for column, count in cardinality.items() if count <= PROGRESSIVE_MAX_STRATA]
+    if not strata:
+        return df.sample(frac=fraction, random_state=0)
+
+    # Sample every group of the lowest-cardinality column proportionally so
+    # small groups keep their share of the sample.
+    column = min(strata, key=cardinality.get)
+    return df.groupby(column, group_keys=False, observed=True, dropna=False).sample(frac=fraction, random_state=0)
+
+
+def generated_code(result):
+    codes = []
+    for action, _ in result.get("intermediate_steps", []):
+        code = action.tool_input
+        if isinstance(code, dict):
+            code = code.get("query", "")
+        codes.append(code)
+    return codes
+
+
+def run_generated_code(tool, codes):
+    output = ""
+    for code in codes:
+        output = str(tool.run(code))
+    return output
+
+
+def numbers_in(text):
+    return [float(number) for number in NUMBER_PATTERN.findall(text)]
+
+
+# The output with its numbers blanked out. Numbers are only paired by
+# position between outputs with the same layout, so a reordered
+# value_counts() or sorted groupby doesn't mix up its groups.
+def output_layout(text):
+    return re.sub(r"\s+", " ", NUMBER_PATTERN.sub("#", text)).strip()
+
+
+def format_number(value):
+    return f"{value:,.0f}" if abs(value) >= 1000 else f"{value:.4g}"
+
+
+# Runs the generated code on the sample and annotates every number in its
+# output with a bootstrap 95% error bound.
+def estimate_output(codes, sample, total_rows, token):
+    def run(df):
+        token.check()
+        # Plots drawn on the sample are dropped, only the exact run's are shown
+        with capture_figures(any(may_plot(code) for code in codes)):
+            return run_generated_code(PythonAstREPLTool(locals={"df": df}), codes)
+
+    output = run(sample)
+    values = numbers_in(output)
+    if not values:
+        return output
+    layout = output_layout(output)
+
+    # Totals (sums, counts) roughly halve on half the sample and are scaled
+    # up to the full frame, means and ratios are left as they are.
+    half = run(sample.sample(frac=0.5, random_state=1))
+    scale = total_rows / len(sample)
+    factors = [1.0] * len(values)
+    if output_layout(half) == layout:
+        factors = [scale if value and 0.35 < h / value < 0.65 else 1.0 for value, h in zip(values, numbers_in(half))]
+
+    replicates = []
+    for seed in range(PROGRESSIVE_BOOTSTRAP):
+        replicate = run(sample.sample(frac=1.0, replace=True, random_state=seed))
+        if output_layout(replicate) == layout:
+            replicates.append(numbers_in(replicate))
+
+    positions = iter(range(len(values)))
+
+    def annotate(match):
+        i = next(positions)
+        spread = statistics.stdev(r[i] for r in replicates) * 1.96 * factors[i] if len(replicates) > 1 else 0
+        if factors[i] == 1.0 and not spread:
+            return match.group(0)  # Labels and constants don't vary with the sample.
+        text = "~" + format_number(values[i] * factors[i])
+        return f"{text} ± {format_number(spread)}" if spread else text
+
+    return NUMBER_PATTERN.sub(annotate, output)
 
 
 def query_prediction(payload):
     PREDICT_URL = os.getenv("PREDICT_URL")
-    response = requests.post(PREDICT_URL, json=payload)
+    with WARM_UP.first_query("flowise"):
+        # Predictions are idempotent, so they may be hedged
+        response = call_hedged("flowise-predict", lambda: HTTP_SESSION.post(PREDICT_URL, json=payload))
     return response.json()
 
 
+# Give up waiting for a namespace to become searchable after this long.
+NAMESPACE_READY_TIMEOUT = 120.0
+
+_pinecone_lock = threading.Lock()
+_pinecone_index = {}
+
+
+def pinecone_index():
+    api_key = os.getenv("PINECONE_API_KEY")
+    index_name = os.getenv("PINECONE_INDEX_NAME")
+    if not (api_key and index_name):
+        return None
+
+    # Reuse the client and index handle until the credentials change
+    with _pinecone_lock:
+        if _pinecone_index.get("config") != (api_key, index_name):
+            pc = Pinecone(api_key=api_key)
+            _pinecone_index["index"] = pc.Index(index_name)
+            _pinecone_index["config"] = (api_key, index_name)
+        return _pinecone_index["index"]
+
+
+def upserted_vector_count(response):
+    try:
+        body = response.json()
+    except requests.exceptions.JSONDecodeError:
+        return 1
+    return max(1, int(body.get("numAdded") or 0) + int(body.get("numUpdated") or 0))
+
+
+def namespace_vector_count(stats, namespace):
+    summary = (getattr(stats, "namespaces", None) or {}).get(namespace)
+    return getattr(summary, "vector_count", 0) if summary is not None else 0
+
+
+# Polls the index stats until the namespace holds the expected number of
+# vectors. Returns the time it took, or None when Pinecone isn't configured.
+def wait_until_searchable(namespace, expected):
+    index = pinecone_index()
+    if index is None:
+        return None
+
+    started = time.monotonic()
+    delay = 0.25
+    last_count, last_checked = 0, started
+    while True:
+        stats = call_endpoint("pinecone", lambda: index.describe_index_stats())
+        count = namespace_vector_count(stats, namespace)
+        now = time.monotonic()
+        if count >= expected:
+            elapsed = now - started
+            METRICS.record("time_to_searchable", elapsed)
+            return elapsed
+        if now - started > NAMESPACE_READY_TIMEOUT:
+            raise TimeoutError(f"only {count} of {expected} vectors are searchable after {int(now - started)}s")
+
+        if count > last_count:
+            # Vectors are arriving, so aim the next poll at the projected finish.
+            rate = (count - last_count) / (now - last_checked)
+            delay = (expected - count) / rate
+        else:
+            delay *= 2
+        delay = min(max(delay, 0.25), 5.0)
+        last_count, last_checked = count, now
+        _backoff(delay)
+
+
+# Tracks whether the backends were warmed up before the first question of each
+# kind since launch or the last configuration change, and records its latency.
+class WarmUpTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._warm = False
+        self._asked = set()
+
+    def reset(self):
+        with self._lock:
+            self._epoch += 1
+            self._warm = False
+            self._asked = set()
+            return self._epoch
+
+    def mark_warm(self, epoch):
+        with self._lock:
+            if epoch == self._epoch:
+                self._warm = True
+
+    @contextmanager
+    def first_query(self, kind):
+        with self._lock:
+            first = kind not in self._asked
+            self._asked.add(kind)
+            state = "warm" if self._warm else "cold"
+        started = time.monotonic()
+        yield
+        if first:
+            METRICS.record(f"first_query_latency_{kind}_{state}", time.monotonic() - started)
+
+
+WARM_UP = WarmUpTracker()
+
+
+def warm_up_enabled():
+    return os.getenv("WARM_UP", "true").lower() not in ("0", "false", "no")
+
+
+# Opens pooled connections to the configured backends, builds their clients and
+# probes their health, so the first question doesn't pay for any of it.
+def warm_up_backends(llm=None):
+    timings = {}
+
+    def step(name, warm):
+        started = time.monotonic()
+        try:
+            warm()
+            timings[name] = time.monotonic() - started
+        except Exception as e:
+            print(f"Warm-up of {name} failed: {str(e)}")
+
+    origins = []
+    for variable in ("PREDICT_URL", "PDF_UPSERT_URL", "DOCX_UPSERT_URL", "WEB_UPSERT_URL"):
+        url = os.getenv(variable)
+        if url:
+            parts = urlsplit(url)
+            origin = f"{parts.scheme}://{parts.netloc}"
+            if origin not in origins:
+                origins.append(origin)
+    for origin in origins:
+        # Flowise's health endpoint, answering it leaves a keep-alive connection in the pool
+        step(f"Flowise {origin}", lambda: HTTP_SESSION.get(f"{origin}/api/v1/ping", timeout=5).raise_for_status())
+
+    if pinecone_index() is not None:
+        step("Pinecone", lambda: pinecone_index().describe_index_stats())
+    if llm is not None:
+        step("OpenAI", lambda: llm.root_client.models.list())
+    return timings
+
+
+def describe_query_error(error):
+    if isinstance(error, RequestCancelled):
+        return "Request cancelled."
+    return f"An error occurred: {str(error)}"
+
+
+# Token budgets for the history sent with each document chat question. The
+# rolling summary of older turns counts against HISTORY_TOKEN_BUDGET.
+HISTORY_TOKEN_BUDGET = 1500
+SUMMARY_TOKEN_BUDGET = 300
+
+_encoding = None
+
+
+# tiktoken may download the encoding on first use, so it's loaded on a
+# background thread at startup and never by count_tokens.
+def load_encoding():
+    global _encoding
+    try:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"Error loading the token encoding, estimating token counts instead: {str(e)}")
+
+
+def count_tokens(text):
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def format_transcript(turns):
+    return "\n".join(f"{'User' if role == 'userMessage' else 'Assistant'}: {content}" for role, content, _ in turns)
+
+
+def tail_summary(summary, turns):
+    # Keep the most recent part of the transcript, needs no model.
+    text = f"{summary}\n{format_transcript(turns)}".strip()
+    return text[-SUMMARY_TOKEN_BUDGET * 4:]
+
+
+def summarize_turns(summary, turns):
+    transcript = format_transcript(turns)
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key:
+        llm = ChatOpenAI(model_name="gpt-3.5-turbo-0125", temperature=0, openai_api_key=api_key,
+                         max_tokens=SUMMARY_TOKEN_BUDGET)
+        prompt = (
+            "Update the running summary of a conversation about a document with the new turns below. "
+            "Keep names, numbers and open questions, and stay under 150 words.\n\n"
+            f"Current summary:\n{summary or '(empty)'}\n\nNew turns:\n{transcript}"
+        )
+        return llm.invoke(prompt).content.strip()
+
+    return tail_summary(summary, turns)
+
+
+# Keeps the newest turns that fit the token budget and folds older turns into
+# a rolling summary on a background thread, so the history sent with each
+# question stays the same size however long the conversation runs.
+class ConversationMemory:
+    _executor = ThreadPoolExecutor(max_workers=1)
+
+    def __init__(self, token_budget=HISTORY_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self._lock = threading.Lock()
+        self._turns = []
+        self._evicted = []
+        self._summary = ""
+        self._summary_tokens = 0
+        self._summarizing = False
+
+    def add_turn(self, question, answer):
+        turns = [("userMessage", question, count_tokens(question)), ("apiMessage", answer, count_tokens(answer))]
+        with self._lock:
+            self._turns.extend(turns)
+
+            while self._turns and self._window_tokens() > self.token_budget:
+                self._evicted.append(self._turns.pop(0))
+            self._schedule_summary()
+
+    def history(self):
+        with self._lock:
+            messages = []
+            if self._summary:
+                messages.append({"role": "apiMessage", "content": f"Summary of the earlier conversation: {self._summary}"})
+            messages.extend({"role": role, "content": content} for role, content, _ in self._turns)
+            return messages
+
+    def _window_tokens(self):
+        return self._summary_tokens + sum(tokens for _, _, tokens in self._turns)
+
+    def _schedule_summary(self):
+        if self._evicted and not self._summarizing:
+            self._summarizing = True
+            turns, self._evicted = self._evicted, []
+            self._executor.submit(self._summarize, self._summary, turns)
+
+    def _summarize(self, summary, turns):
+        try:
+            summary = summarize_turns(summary, turns)
+        except Exception as e:
+            # Don't retry the model, fold the turns in offline so a bad key or
+            # a network outage can't keep resubmitting the same batch.
+            print(f"Error summarizing conversation: {str(e)}")
+            summary = tail_summary(summary, turns)
+
+        summary_tokens = count_tokens(summary)
+        with self._lock:
+            self._summarizing = False
+            self._summary, self._summary_tokens = summary, summary_tokens
+            # A longer summary may push the oldest turns out of the window.
+            while self._turns and self._window_tokens() > self.token_budget:
+                self._evicted.append(self._turns.pop(0))
+            self._schedule_summary()
+
+
 class PDFChatWidget(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -119,12 +1433,19 @@ class PDFChatWidget(QWidget):
         self.send_button = QPushButton("Send", self)
         self.send_button.clicked.connect(self.send_query)
 
+        self.cancel_button = QPushButton("Cancel", self)
+        self.cancel_button.clicked.connect(self.cancel_query)
+        self.cancel_button.setEnabled(False)
+
         self.layout.addWidget(self.messages)
         self.layout.addWidget(self.input_field)
         self.layout.addWidget(self.upload_button)
         self.layout.addWidget(self.send_button)
+        self.layout.addWidget(self.cancel_button)
 
         self.namespace_id = None
+        self.memory = ConversationMemory()
+        self.target = "PDF"
 
     def upload_pdf(self):
         file_dialog = QFileDialog(self)
@@ -137,45 +1458,67 @@ class PDFChatWidget(QWidget):
             QTimer.singleShot(100, lambda: self.start_upsert(file_path))
 
     def start_upsert(self, file_path):
-        try:
-            # Generate a unique namespace ID
-            self.namespace_id = str(uuid.uuid4())
+        self.send_button.setEnabled(False)
 
-            output = self.upsert(file_path, self.namespace_id)
+        # Generate a unique namespace ID, the previous conversation no longer applies
+        self.namespace_id = str(uuid.uuid4())
+        self.memory = ConversationMemory()
+        namespace = self.namespace_id
 
-            if "successfully upserted" in output:
-                self.model.add_message(USER_THEM, "PDF file successfully upserted!")
-                self.upload_button.setText("PDF Upserted")
-            else:
-                self.model.add_message(USER_THEM, str(output))
-                self.upload_button.setText("Upload PDF")
-                self.upload_button.setEnabled(True)
+        key = (self.target, namespace, "upsert")
+        request_registry().submit(key, lambda token: self.upsert(file_path, namespace), self.finish_upsert)
 
-            self.messages.scrollToBottom()
-        except Exception as e:
-            error_message = f"An error occurred: {str(e)}"
-            self.model.add_message(USER_THEM, error_message)
+    def finish_upsert(self, output, error):
+        if error is None and "successfully upserted" in output[0]:
+            self.model.add_message(USER_THEM, "PDF file successfully upserted! Waiting for it to become searchable...")
+            self.upload_button.setText("Indexing")
+
+            # Only enable queries once Pinecone can see the upserted vectors
+            namespace, expected = self.namespace_id, output[1]
+            key = (self.target, namespace, "ready")
+            request_registry().submit(key, lambda token: wait_until_searchable(namespace, expected), self.finish_indexing)
+        else:
+            message = describe_query_error(error) if error is not None else str(output[0])
+            self.model.add_message(USER_THEM, message)
             self.upload_button.setText("Upload PDF")
             self.upload_button.setEnabled(True)
-        finally:
-            self.upload_button.setIcon(QIcon())
+            self.send_button.setEnabled(True)
+
+        self.upload_button.setIcon(QIcon())
+        self.messages.scrollToBottom()
+
+    def finish_indexing(self, elapsed, error):
+        if error is not None:
+            self.model.add_message(USER_THEM, f"Could not confirm the PDF file is searchable yet, early answers may be incomplete. ({describe_query_error(error)})")
+        elif elapsed is not None:
+            self.model.add_message(USER_THEM, f"PDF file is searchable (after {elapsed:.1f}s).")
+
+        self.upload_button.setText("PDF Upserted")
+        self.send_button.setEnabled(True)
+        self.messages.scrollToBottom()
 
     def upsert(self, file_path, namespace):
         filename = os.path.basename(file_path)
-        form_data = {"files": (filename, open(file_path, 'rb'), 'application/pdf')}
         body_data = {"pineconeNamespace": namespace}
 
         PDF_UPSERT_URL = os.getenv("PDF_UPSERT_URL")
-        response = requests.post(PDF_UPSERT_URL, files=form_data, data=body_data)
+
+        def send():
+            # Reopen the file on every attempt so retries upload it from the start
+            with open(file_path, 'rb') as f:
+                form_data = {"files": (filename, f, 'application/pdf')}
+                return HTTP_SESSION.post(PDF_UPSERT_URL, files=form_data, data=body_data)
+
+        response = call_endpoint("flowise-upsert", send)
 
         if response.status_code == 201:
-            return "Document successfully upserted!"
+            return "Document successfully upserted!", upserted_vector_count(response)
         else:
             try:
                 error_message = response.json().get("message", "Unknown error")
-                return f"Error: {error_message}"
+                return f"Error: {error_message}", None
             except requests.exceptions.JSONDecodeError:
-                return "Error: Invalid JSON response from the API"
+                return "Error: Invalid JSON response from the API", None
 
     def send_query(self):
         if self.upload_button.text() == "PDF Upserted":
@@ -185,38 +1528,41 @@ class PDFChatWidget(QWidget):
                 self.input_field.clear()
                 self.messages.scrollToBottom()
 
-                self.send_button.setEnabled(False)
-                self.send_button.setText("Loading")
+                payload = {
+                    "question": query,
+                    "history": self.memory.history(),
+                    "overrideConfig": {
+                        "pineconeNamespace": self.namespace_id
+                    }
+                }
 
-                # Add a small delay before sending the query
-                QTimer.singleShot(100, lambda: self.start_query(query))
+                # Identical questions against the same namespace share one request
+                key = (self.target, self.namespace_id, query)
+                # A coalesced duplicate shows the answer but doesn't add the turn again
+                registry = request_registry()
+                memory = None if registry.is_pending(key) else self.memory
+                registry.submit(key, lambda token: query_prediction(payload),
+                                lambda output, error: self.finish_query(memory, query, output, error))
+                self.cancel_button.setEnabled(True)
         else:
             self.model.add_message(USER_THEM, "Please upload a PDF file first.")
 
-    def start_query(self, query):
-        try:
-            payload = {
-                "question": query,
-                "overrideConfig":{
-                "pineconeNamespace": self.namespace_id
-                }
-            }
-
-            output = query_prediction(payload)
+    def finish_query(self, memory, query, output, error):
+        if error is not None:
+            self.model.add_message(USER_THEM, describe_query_error(error))
+        elif "text" in output:
+            response_text = output["text"]
+            self.model.add_message(USER_THEM, response_text)
+            if memory is not None:
+                memory.add_turn(query, response_text)
+        else:
+            self.model.add_message(USER_THEM, "Sorry, I couldn't generate a response.")
 
-            if "text" in output:
-                response_text = output["text"]
-                self.model.add_message(USER_THEM, response_text)
-            else:
-                self.model.add_message(USER_THEM, "Sorry, I couldn't generate a response.")
+        self.messages.scrollToBottom()
+        self.cancel_button.setEnabled(request_registry().has_pending(self.target))
 
-            self.messages.scrollToBottom()
-        except Exception as e:
-            error_message = f"An error occurred: {str(e)}"
-            self.model.add_message(USER_THEM, error_message)
-        finally:
-            self.send_button.setText("Send")
-            self.send_button.setEnabled(True)
+    def cancel_query(self):
+        request_registry().cancel_target(self.target)
 
 
 class DOCXChatWidget(QWidget):
@@ -238,12 +1584,19 @@ class DOCXChatWidget(QWidget):
         self.send_button = QPushButton("Send", self)
         self.send_button.clicked.connect(self.send_query)
 
+        self.cancel_button = QPushButton("Cancel", self)
+        self.cancel_button.clicked.connect(self.cancel_query)
+        self.cancel_button.setEnabled(False)
+
         self.layout.addWidget(self.messages)
         self.layout.addWidget(self.input_field)
         self.layout.addWidget(self.upload_button)
         self.layout.addWidget(self.send_button)
+        self.layout.addWidget(self.cancel_button)
 
         self.namespace_id = None
+        self.memory = ConversationMemory()
+        self.target = "DOCX"
 
     def upload_docx(self):
         file_dialog = QFileDialog(self)
@@ -256,45 +1609,67 @@ class DOCXChatWidget(QWidget):
             QTimer.singleShot(100, lambda: self.start_upsert(file_path))
 
     def start_upsert(self, file_path):
-        try:
-            # Generate a unique namespace ID
-            self.namespace_id = str(uuid.uuid4())
+        self.send_button.setEnabled(False)
 
-            output = self.upsert(file_path, self.namespace_id)
+        # Generate a unique namespace ID, the previous conversation no longer applies
+        self.namespace_id = str(uuid.uuid4())
+        self.memory = ConversationMemory()
+        namespace = self.namespace_id
 
-            if "successfully upserted" in output:
-                self.model.add_message(USER_THEM, "DOCX file successfully upserted!")
-                self.upload_button.setText("DOCX Upserted")
-            else:
-                self.model.add_message(USER_THEM, str(output))
-                self.upload_button.setText("Upload DOCX")
-                self.upload_button.setEnabled(True)
+        key = (self.target, namespace, "upsert")
+        request_registry().submit(key, lambda token: self.upsert(file_path, namespace), self.finish_upsert)
 
-            self.messages.scrollToBottom()
-        except Exception as e:
-            error_message = f"An error occurred: {str(e)}"
-            self.model.add_message(USER_THEM, error_message)
+    def finish_upsert(self, output, error):
+        if error is None and "successfully upserted" in output[0]:
+            self.model.add_message(USER_THEM, "DOCX file successfully upserted! Waiting for it to become searchable...")
+            self.upload_button.setText("Indexing")
+
+            # Only enable queries once Pinecone can see the upserted vectors
+            namespace, expected = self.namespace_id, output[1]
+            key = (self.target, namespace, "ready")
+            request_registry().submit(key, lambda token: wait_until_searchable(namespace, expected), self.finish_indexing)
+        else:
+            message = describe_query_error(error) if error is not None else str(output[0])
+            self.model.add_message(USER_THEM, message)
             self.upload_button.setText("Upload DOCX")
             self.upload_button.setEnabled(True)
-        finally:
-            self.upload_button.setIcon(QIcon())
+            self.send_button.setEnabled(True)
+
+        self.upload_button.setIcon(QIcon())
+        self.messages.scrollToBottom()
+
+    def finish_indexing(self, elapsed, error):
+        if error is not None:
+            self.model.add_message(USER_THEM, f"Could not confirm the DOCX file is searchable yet, early answers may be incomplete. ({describe_query_error(error)})")
+        elif elapsed is not None:
+            self.model.add_message(USER_THEM, f"DOCX file is searchable (after {elapsed:.1f}s).")
+
+        self.upload_button.setText("DOCX Upserted")
+        self.send_button.setEnabled(True)
+        self.messages.scrollToBottom()
 
     def upsert(self, file_path, namespace):
         filename = os.path.basename(file_path)
-        form_data = {"files": (filename, open(file_path, 'rb'), 'application/docx')}
         body_data = {"pineconeNamespace": namespace}
 
         DOCX_UPSERT_URL = os.getenv("DOCX_UPSERT_URL")
-        response = requests.post(DOCX_UPSERT_URL, files=form_data, data=body_data)
+
+        def send():
+            # Reopen the file on every attempt so retries upload it from the start
+            with open(file_path, 'rb') as f:
+                form_data = {"files": (filename, f, 'application/docx')}
+                return HTTP_SESSION.post(DOCX_UPSERT_URL, files=form_data, data=body_data)
+
+        response = call_endpoint("flowise-upsert", send)
 
         if response.status_code == 201:
-            return "Document successfully upserted!"
+            return "Document successfully upserted!", upserted_vector_count(response)
         else:
             try:
                 error_message = response.json().get("message", "Unknown error")
-                return f"Error: {error_message}"
+                return f"Error: {error_message}", None
             except requests.exceptions.JSONDecodeError:
-                return "Error: Invalid JSON response from the API"
+                return "Error: Invalid JSON response from the API", None
 
     def send_query(self):
         if self.upload_button.text() == "DOCX Upserted":
@@ -304,38 +1679,41 @@ class DOCXChatWidget(QWidget):
                 self.input_field.clear()
                 self.messages.scrollToBottom()
 
-                self.send_button.setEnabled(False)
-                self.send_button.setText("Loading")
+                payload = {
+                    "question": query,
+                    "history": self.memory.history(),
+                    "overrideConfig": {
+                        "pineconeNamespace": self.namespace_id
+                    }
+                }
 
-                # Add a small delay before sending the query
-                QTimer.singleShot(100, lambda: self.start_query(query))
+                # Identical questions against the same namespace share one request
+                key = (self.target, self.namespace_id, query)
+                # A coalesced duplicate shows the answer but doesn't add the turn again
+                registry = request_registry()
+                memory = None if registry.is_pending(key) else self.memory
+                registry.submit(key, lambda token: query_prediction(payload),
+                                lambda output, error: self.finish_query(memory, query, output, error))
+                self.cancel_button.setEnabled(True)
         else:
             self.model.add_message(USER_THEM, "Please upload a DOCX file first.")
 
-    def start_query(self, query):
-        try:
-            payload = {
-                "question": query,
-                "overrideConfig":{
-                "pineconeNamespace": self.namespace_id
-                }
-            }
-
-            output = query_prediction(payload)
+    def finish_query(self, memory, query, output, error):
+        if error is not None:
+            self.model.add_message(USER_THEM, describe_query_error(error))
+        elif "text" in output:
+            response_text = output["text"]
+            self.model.add_message(USER_THEM, response_text)
+            if memory is not None:
+                memory.add_turn(query, response_text)
+        else:
+            self.model.add_message(USER_THEM, "Sorry, I couldn't generate a response.")
 
-            if "text" in output:
-                response_text = output["text"]
-                self.model.add_message(USER_THEM, response_text)
-            else:
-                self.model.add_message(USER_THEM, "Sorry, I couldn't generate a response.")
+        self.messages.scrollToBottom()
+        self.cancel_button.setEnabled(request_registry().has_pending(self.target))
 
-            self.messages.scrollToBottom()
-        except Exception as e:
-            error_message = f"An error occurred: {str(e)}"
-            self.model.add_message(USER_THEM, error_message)
-        finally:
-            self.send_button.setText("Send")
-            self.send_button.setEnabled(True)
+    def cancel_query(self):
+        request_registry().cancel_target(self.target)
 
 
 class WEBChatWidget(QWidget):
@@ -357,12 +1735,19 @@ class WEBChatWidget(QWidget):
         self.send_button = QPushButton("Send", self)
         self.send_button.clicked.connect(self.send_query)
 
+        self.cancel_button = QPushButton("Cancel", self)
+        self.cancel_button.clicked.connect(self.cancel_query)
+        self.cancel_button.setEnabled(False)
+
         self.layout.addWidget(self.messages)
         self.layout.addWidget(self.input_field)
         self.layout.addWidget(self.upload_button)
         self.layout.addWidget(self.send_button)
+        self.layout.addWidget(self.cancel_button)
 
         self.namespace_id = None
+        self.memory = ConversationMemory()
+        self.target = "WEB"
 
     def upload_web(self):
         dialog = QDialog(self)
@@ -389,28 +1774,44 @@ class WEBChatWidget(QWidget):
                 QTimer.singleShot(100, lambda: self.start_upsert(url))
 
     def start_upsert(self, url):
-        try:
-            # Generate a unique namespace ID
-            self.namespace_id = str(uuid.uuid4())
+        self.send_button.setEnabled(False)
 
-            output = self.upsert(url, self.namespace_id)
+        # Generate a unique namespace ID, the previous conversation no longer applies
+        self.namespace_id = str(uuid.uuid4())
+        self.memory = ConversationMemory()
+        namespace = self.namespace_id
 
-            if "successfully upserted" in output:
-                self.model.add_message(USER_THEM, "Webpage successfully upserted!")
-                self.upload_button.setText("Webpage Upserted")
-            else:
-                self.model.add_message(USER_THEM, str(output))
-                self.upload_button.setText("Upload Webpage")
-                self.upload_button.setEnabled(True)
+        key = (self.target, namespace, "upsert")
+        request_registry().submit(key, lambda token: self.upsert(url, namespace), self.finish_upsert)
 
-            self.messages.scrollToBottom()
-        except Exception as e:
-            error_message = f"An error occurred: {str(e)}"
-            self.model.add_message(USER_THEM, error_message)
+    def finish_upsert(self, output, error):
+        if error is None and "successfully upserted" in output[0]:
+            self.model.add_message(USER_THEM, "Webpage successfully upserted! Waiting for it to become searchable...")
+            self.upload_button.setText("Indexing")
+
+            # Only enable queries once Pinecone can see the upserted vectors
+            namespace, expected = self.namespace_id, output[1]
+            key = (self.target, namespace, "ready")
+            request_registry().submit(key, lambda token: wait_until_searchable(namespace, expected), self.finish_indexing)
+        else:
+            message = describe_query_error(error) if error is not None else str(output[0])
+            self.model.add_message(USER_THEM, message)
             self.upload_button.setText("Upload Webpage")
             self.upload_button.setEnabled(True)
-        finally:
-            self.upload_button.setIcon(QIcon())
+            self.send_button.setEnabled(True)
+
+        self.upload_button.setIcon(QIcon())
+        self.messages.scrollToBottom()
+
+    def finish_indexing(self, elapsed, error):
+        if error is not None:
+            self.model.add_message(USER_THEM, f"Could not confirm the Webpage is searchable yet, early answers may be incomplete. ({describe_query_error(error)})")
+        elif elapsed is not None:
+            self.model.add_message(USER_THEM, f"Webpage is searchable (after {elapsed:.1f}s).")
+
+        self.upload_button.setText("Webpage Upserted")
+        self.send_button.setEnabled(True)
+        self.messages.scrollToBottom()
 
     def upsert(self, url, namespace):
         payload = {
@@ -421,16 +1822,16 @@ class WEBChatWidget(QWidget):
         }
 
         WEB_UPSERT_URL = os.getenv("WEB_UPSERT_URL")
-        response = requests.post(WEB_UPSERT_URL, json=payload)
+        response = call_endpoint("flowise-upsert", lambda: HTTP_SESSION.post(WEB_UPSERT_URL, json=payload))
 
         if response.status_code == 201:
-            return "Webpage successfully upserted!"
+            return "Webpage successfully upserted!", upserted_vector_count(response)
         else:
             try:
                 error_message = response.json().get("message", "Unknown error")
-                return f"Error: {error_message}"
+                return f"Error: {error_message}", None
             except requests.exceptions.JSONDecodeError:
-                return "Error: Invalid JSON response from the API"
+                return "Error: Invalid JSON response from the API", None
 
     def send_query(self):
         if self.upload_button.text() == "Webpage Upserted":
@@ -440,38 +1841,41 @@ class WEBChatWidget(QWidget):
                 self.input_field.clear()
                 self.messages.scrollToBottom()
 
-                self.send_button.setEnabled(False)
-                self.send_button.setText("Loading")
+                payload = {
+                    "question": query,
+                    "history": self.memory.history(),
+                    "overrideConfig": {
+                        "pineconeNamespace": self.namespace_id
+                    }
+                }
 
-                # Add a small delay before sending the query
-                QTimer.singleShot(100, lambda: self.start_query(query))
+                # Identical questions against the same namespace share one request
+                key = (self.target, self.namespace_id, query)
+                # A coalesced duplicate shows the answer but doesn't add the turn again
+                registry = request_registry()
+                memory = None if registry.is_pending(key) else self.memory
+                registry.submit(key, lambda token: query_prediction(payload),
+                                lambda output, error: self.finish_query(memory, query, output, error))
+                self.cancel_button.setEnabled(True)
         else:
             self.model.add_message(USER_THEM, "Please upload a Webpage first.")
 
-    def start_query(self, query):
-        try:
-            payload = {
-                "question": query,
-                "overrideConfig": {
-                    "pineconeNamespace": self.namespace_id
-                }
-            }
-
-            output = query_prediction(payload)
+    def finish_query(self, memory, query, output, error):
+        if error is not None:
+            self.model.add_message(USER_THEM, describe_query_error(error))
+        elif "text" in output:
+            response_text = output["text"]
+            self.model.add_message(USER_THEM, response_text)
+            if memory is not None:
+                memory.add_turn(query, response_text)
+        else:
+            self.model.add_message(USER_THEM, "Sorry, I couldn't generate a response.")
 
-            if "text" in output:
-                response_text = output["text"]
-                self.model.add_message(USER_THEM, response_text)
-            else:
-                self.model.add_message(USER_THEM, "Sorry, I couldn't generate a response.")
+        self.messages.scrollToBottom()
+        self.cancel_button.setEnabled(request_registry().has_pending(self.target))
 
-            self.messages.scrollToBottom()
-        except Exception as e:
-            error_message = f"An error occurred: {str(e)}"
-            self.model.add_message(USER_THEM, error_message)
-        finally:
-            self.send_button.setText("Send")
-            self.send_button.setEnabled(True)
+    def cancel_query(self):
+        request_registry().cancel_target(self.target)
 
 
 class MainWindow(QMainWindow):
@@ -495,6 +1899,11 @@ class MainWindow(QMainWindow):
             with open(self.env_path, 'w') as f:
                 pass  # Create an empty .env file
 
+        # Persistent caches for LLM completions and agent tool runs
+        cache_path = os.path.join(env_dir, 'cache.sqlite')
+        self.llm_cache = LLMCache(PersistentLRUCache(cache_path, "llm_cache", LLM_CACHE_MAX_ENTRIES))
+        self.tool_cache = PersistentLRUCache(cache_path, "tool_cache", TOOL_CACHE_MAX_ENTRIES)
+
         central_widget = QWidget(self)
         main_layout = QHBoxLayout(central_widget)
         self.setCentralWidget(central_widget)
@@ -541,22 +1950,41 @@ class MainWindow(QMainWindow):
         flowise_action = toolbar.addAction("Flowise", lambda: self.show_config_dialog("Flowise"))
         pinecone_action = toolbar.addAction("Pinecone", lambda: self.show_config_dialog("Pinecone"))
 
+        # Show the circuit breaker state of each backend
+        self.backend_status = QLabel()
+        self.statusBar().addPermanentWidget(self.backend_status)
+        self.backend_status_timer = QTimer(self)
+        self.backend_status_timer.timeout.connect(self.update_backend_status)
+        self.backend_status_timer.start(1000)
+        self.update_backend_status()
+
         self.messages = QListView()
         self.messages.setItemDelegate(MessageDelegate())
         self.model = MessageModel()
         self.messages.setModel(self.model)
 
         self.input_field = QLineEdit()
-        self.input_field.setPlaceholderText(" Upload CSV and Enter Your Query Here... ")
-        upload_button = QPushButton("Upload CSV", self)
-        upload_button.clicked.connect(self.upload_csv)
+        self.input_field.setPlaceholderText(" Upload CSVs and Enter Your Query Here... ")
+        self.upload_button = QPushButton("Upload CSV", self)
+        self.upload_button.clicked.connect(self.upload_csv)
+        self.clear_button = QPushButton("Clear CSVs", self)
+        self.clear_button.clicked.connect(self.clear_csvs)
         self.send_button = QPushButton("Send", self)
         self.send_button.clicked.connect(self.send_query)
+        self.cancel_button = QPushButton("Cancel", self)
+        self.cancel_button.clicked.connect(self.cancel_query)
+        self.cancel_button.setEnabled(False)
+        self.progressive_checkbox = QCheckBox("Progressive answers (sample first on large CSVs)", self)
 
         agent_layout.addWidget(self.messages)
         agent_layout.addWidget(self.input_field)
-        agent_layout.addWidget(upload_button)
+        agent_layout.addWidget(self.progressive_checkbox)
+        csv_layout = QHBoxLayout()
+        csv_layout.addWidget(self.upload_button)
+        csv_layout.addWidget(self.clear_button)
+        agent_layout.addLayout(csv_layout)
         agent_layout.addWidget(self.send_button)
+        agent_layout.addWidget(self.cancel_button)
 
         # Load credentials
         load_dotenv(self.env_path)
@@ -566,13 +1994,17 @@ class MainWindow(QMainWindow):
 
         if api_key:
             # Initialize language model for agent
-            self.llm = ChatOpenAI(model_name="gpt-3.5-turbo-0125", temperature=0, openai_api_key=api_key)
+            self.llm = ChatOpenAI(model_name="gpt-3.5-turbo-0125", temperature=0, openai_api_key=api_key, cache=self.llm_cache)
 
         else:
             self.model.add_message(USER_THEM, "OpenAI API Key Not Found! Please Update in OpenAI Toolbar")
 
-        self.df = None
+        self.tables = TableSet()
+        self.prebuilt_agents = {}
 
+        # Warm the backends up once the window is idle
+        self.warm_up_epoch = WARM_UP.reset()
+        QTimer.singleShot(500, self.start_warm_up)
 
     def switch_menu(self, item):
         if item.text() == "PANDAS UI":
@@ -584,13 +2016,86 @@ class MainWindow(QMainWindow):
         elif item.text() == "WEB CHAT":
             self.stacked_widget.setCurrentWidget(self.web_chat_widget)
 
+    def update_backend_status(self):
+        states = [f"{endpoint.name}: {endpoint.breaker.state}" for endpoint in ENDPOINTS.values()]
+        for label, cache in (("LLM cache", self.llm_cache.store), ("Tool cache", self.tool_cache)):
+            hit_rate = cache.hit_rate()
+            if hit_rate is not None:
+                states.append(f"{label}: {hit_rate:.0%} hits")
+        self.backend_status.setText("  |  ".join(states))
+
     def upload_csv(self):
         file_dialog = QFileDialog(self)
-        file_path, _ = file_dialog.getOpenFileName(self, "Open CSV", "", "CSV Files (*.csv)")
-        if file_path:
-            self.df = pd.read_csv(file_path)
-            self.model.add_message(USER_THEM, "CSV file uploaded successfully.")
+        file_paths, _ = file_dialog.getOpenFileNames(self, "Open CSV", "", "CSV Files (*.csv)")
+        if file_paths:
+            self.upload_button.setEnabled(False)
+            self.upload_button.setText("Loading")
+            self.clear_button.setEnabled(False)
+            # Reading, fingerprinting and indexing large CSVs happens off the UI thread
+            base = self.tables
+            request_registry().submit(("CSV", tuple(file_paths)), lambda token: self.load_csvs(base, file_paths),
+                                      self.finish_upload_csv)
+
+    def load_csvs(self, base, file_paths):
+        tables = {table_name(file_path): pd.read_csv(file_path) for file_path in file_paths}
+        return base.with_tables(tables), tables
+
+    def finish_upload_csv(self, result, error):
+        self.upload_button.setEnabled(True)
+        self.upload_button.setText("Upload CSV")
+        self.clear_button.setEnabled(True)
+        if error is not None:
+            self.model.add_message(USER_THEM, describe_query_error(error))
             self.messages.scrollToBottom()
+            return
+
+        self.tables, tables = result
+        # Agents prebuilt for the replaced tables won't be asked anything
+        for fingerprint in [fingerprint for fingerprint in self.prebuilt_agents if fingerprint != self.tables.fingerprint]:
+            self.prebuilt_agents.pop(fingerprint, None)
+        for name, df in tables.items():
+            self.model.add_message(USER_THEM, f"CSV file uploaded successfully as {name} ({len(df):,} rows).")
+        if self.tables.join_index is not None:
+            joins = "\n".join(self.tables.join_index.joins) or "none found"
+            self.model.add_message(USER_THEM, f"Tables: {', '.join(self.tables.tables)}\nJoin indexes:\n{joins}")
+        self.messages.scrollToBottom()
+        self.start_warm_up()
+
+    def clear_csvs(self):
+        self.tables = TableSet()
+        self.prebuilt_agents.clear()
+        self.model.add_message(USER_THEM, "All CSV files cleared.")
+        self.messages.scrollToBottom()
+
+    def start_warm_up(self):
+        if not warm_up_enabled():
+            return
+        llm = getattr(self, "llm", None)
+        tables, epoch = self.tables, self.warm_up_epoch
+        key = ("WARMUP", tables.fingerprint, epoch)
+        request_registry().submit(key, lambda token: self.warm_up(llm, tables),
+                                  lambda result, error: self.finish_warm_up(epoch, tables, result, error))
+
+    def warm_up(self, llm, tables):
+        timings = warm_up_backends(llm)
+        agent = None
+        if llm is not None and tables.tables:
+            # Build the agent for the loaded CSVs ahead of their first question
+            started = time.monotonic()
+            agent = (llm, self.build_agent(llm, tables))
+            timings["Pandas agent"] = time.monotonic() - started
+        return timings, agent
+
+    def finish_warm_up(self, epoch, tables, result, error):
+        if error is not None:
+            print(f"Warm-up failed: {str(error)}")
+            return
+        timings, agent = result
+        # Tables replaced while warming up won't be asked about
+        if agent is not None and tables is self.tables:
+            self.prebuilt_agents[tables.fingerprint] = agent
+        WARM_UP.mark_warm(epoch)
+        print("Warm-up finished: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
 
 
     def send_query(self):
@@ -598,9 +2103,13 @@ class MainWindow(QMainWindow):
         When responding, please follow this ONLY guideline:
         *Wrap your entire answer in <answer>...</answer> tags*.
         DO NOT WRAP ANYTHING ELSE WITH TAGS
+        If the answer is a table, assign the resulting DataFrame to a variable named result_df
+        instead of printing it, and keep the tagged answer to a short description of it.
+        If you draw a plot, use matplotlib and do not call plt.show().
         """
         query = self.input_field.text()
-        final_query = f"{prefix} {query}"
+        tables = self.tables
+        final_query = f"{prefix} {tables.describe()} {query}"
 
         if query.lower() == 'exit':
             self.close()
@@ -609,28 +2118,125 @@ class MainWindow(QMainWindow):
             self.input_field.clear()
             self.messages.scrollToBottom()
 
-            self.send_button.setEnabled(False)
-            self.send_button.setText("Loading")
-
-            QTimer.singleShot(100, lambda: self.run_agent_query(final_query))
-
-    def run_agent_query(self, query):
-        try:
-            if self.df is not None:
-                agent = create_pandas_dataframe_agent(self.llm, self.df, verbose=True, agent_type=AgentType.OPENAI_FUNCTIONS)
-                result = agent.invoke({"input": query})
-                response = self.extract_response(result)
-                self.model.add_message(USER_THEM, response)
-                self.messages.scrollToBottom()
-            else:
+            if not tables.tables:
                 self.model.add_message(USER_THEM, "Please upload a CSV file first.")
-        except Exception as e:
-            error_message = f"An error occurred: {str(e)}"
-            self.model.add_message(USER_THEM, error_message)
+                return
+
+            # Identical questions against the same CSV contents share one request
+            df, fingerprint = tables.single, tables.fingerprint
+            if self.progressive_checkbox.isChecked() and df is not None and len(df) >= PROGRESSIVE_MIN_ROWS:
+                key = ("PANDAS", fingerprint, query, "progressive")
+                request_registry().submit(key, lambda token: self.run_progressive_query(df, fingerprint, final_query, token),
+                                          lambda result, error: self.finish_progressive_query(df, fingerprint, query, result, error))
+            else:
+                key = ("PANDAS", fingerprint, query)
+                request_registry().submit(key, lambda token: self.run_agent_query(tables, final_query, token), self.finish_agent_query)
+            self.cancel_button.setEnabled(True)
+
+    def build_agent(self, llm, tables):
+        agent = create_pandas_dataframe_agent(llm, tables.frames, verbose=True, agent_type=AgentType.OPENAI_FUNCTIONS)
+        # Expose every table by name, along with the indexed join helper
+        agent.tools[0].locals.update(tables.agent_locals())
+        return use_cached_tools(agent, self.tool_cache, tables.fingerprint)
+
+    def run_agent_query(self, tables, query, token):
+        # Building the agent is part of what warm-up saves, so it's measured too
+        with WARM_UP.first_query("pandas"):
+            # Use the agent built during warm-up once, as long as the model is unchanged
+            llm, agent = self.prebuilt_agents.pop(tables.fingerprint, (None, None))
+            if agent is None or llm is not self.llm:
+                agent = self.build_agent(self.llm, tables)
+            result = agent.invoke({"input": query}, config={"callbacks": [CancelCallbackHandler(token)]})
+        tool = agent.tools[0]
+        return self.collect_results(self.extract_response(result), tool.locals, tool.charts)
+
+    def collect_results(self, response, tool_locals, charts):
+        responses = [response]
+
+        # Hand back the DataFrame itself rather than a printed version of it
+        table = tool_locals.get("result_df")
+        if isinstance(table, pd.Series):
+            table = table.to_frame()
+        if isinstance(table, pd.DataFrame):
+            responses.append(TableResult(table))
+
+        # Plots were rasterized on the worker thread as the tool drew them
+        responses.extend(charts)
+        return responses
+
+    def finish_agent_query(self, responses, error):
+        if error is not None:
+            self.model.add_message(USER_THEM, describe_query_error(error))
+        else:
+            for response in responses:
+                self.add_agent_response(response)
+        self.messages.scrollToBottom()
+        self.cancel_button.setEnabled(request_registry().has_pending("PANDAS"))
+
+    def add_agent_response(self, response):
+        self.model.add_message(USER_THEM, response)
+        if isinstance(response, TableResult):
+            index = self.model.index(len(self.model.messages) - 1)
+            self.messages.setIndexWidget(index, create_table_widget(response))
+
+    def run_progressive_query(self, df, fingerprint, query, token):
+        sample = stratified_sample(df)
+        agent = create_pandas_dataframe_agent(self.llm, sample, verbose=True, agent_type=AgentType.OPENAI_FUNCTIONS,
+                                              return_intermediate_steps=True)
+        use_cached_tools(agent, self.tool_cache, f"{fingerprint}:sample:{len(sample)}")
+        # Only the exact run's plots are shown, the sample tool's charts are dropped
+        result = agent.invoke({"input": query}, config={"callbacks": [CancelCallbackHandler(token)]})
+
+        codes = generated_code(result)
+        if not codes:
+            return self.extract_response(result), codes
+        estimate = estimate_output(codes, sample, len(df), token)
+        return f"Approximate answer from {len(sample):,} of {len(df):,} rows, refining on the full data...\n{estimate}", codes
+
+    def finish_progressive_query(self, df, fingerprint, query, result, error):
+        if error is not None:
+            self.model.add_message(USER_THEM, describe_query_error(error))
+        else:
+            approximate, codes = result
+            self.model.add_message(USER_THEM, approximate)
+            if codes:
+                # Rerun the same code on the full frame and replace the approximate answer
+                row = len(self.model.messages) - 1
+                key = ("PANDAS", fingerprint, query, "exact")
+                request_registry().submit(key, lambda token: self.run_exact_query(df, fingerprint, query, codes, token),
+                                          lambda responses, error: self.finish_exact_query(row, responses, error))
+        self.messages.scrollToBottom()
+        self.cancel_button.setEnabled(request_registry().has_pending("PANDAS"))
+
+    def run_exact_query(self, df, fingerprint, query, codes, token):
+        tool = CachedPythonAstREPLTool(locals=frame_copies({"df": df}), store=self.tool_cache, fingerprint=fingerprint)
+        output = run_generated_code(tool, codes)
+        token.check()
+
+        prompt = f"""
+        Question: {query}
+        This code was run on the full dataframe df:
+        {chr(10).join(codes)}
+        Its output was:
+        {output}
+        Answer the question using this output. Wrap your entire answer in <answer>...</answer> tags.
+        """
+        response = self.extract_response({"output": self.llm.invoke(prompt).content})
+        return self.collect_results(response, tool.locals, tool.charts)
 
-        self.send_button.setIcon(QIcon())  
-        self.send_button.setText("Send")
-        self.send_button.setEnabled(True)
+    def finish_exact_query(self, row, responses, error):
+        if error is not None:
+            _, approximate = self.model.messages[row]
+            self.model.update_message(row, USER_THEM, f"{approximate}\n({describe_query_error(error)})")
+        else:
+            self.model.update_message(row, USER_THEM, responses[0])
+            for response in responses[1:]:
+                self.add_agent_response(response)
+        self.messages.scrollToBottom()
+        self.cancel_button.setEnabled(request_registry().has_pending("PANDAS"))
+
+    def cancel_query(self):
+        request_registry().cancel_target("PANDAS")
 
     def extract_response(self, result):
         start_tag = "<answer>"
@@ -792,15 +2398,20 @@ class MainWindow(QMainWindow):
 
             if api_key:
                 # Initialize language model for agent
-                self.llm = ChatOpenAI(model_name="gpt-3.5-turbo-0125", temperature=0, openai_api_key=api_key)
+                self.llm = ChatOpenAI(model_name="gpt-3.5-turbo-0125", temperature=0, openai_api_key=api_key, cache=self.llm_cache)
 
             else:
                 self.model.add_message(USER_THEM, "OpenAI API Key Not Found! Please Update in OpenAI Toolbar")
 
+            # New credentials or URLs mean cold backends again
+            self.warm_up_epoch = WARM_UP.reset()
+            self.start_warm_up()
+
             QMessageBox.information(self, "Configuration Saved", "Configuration saved successfully!")
 
     def closeEvent(self, event):
-        # Delete all records from Pinecone namespaces on close
+        # Abandon in-flight requests, then delete all records from Pinecone namespaces on close
+        request_registry().shutdown()
         self.delete_pinecone_records()
         event.accept()
 
@@ -811,20 +2422,19 @@ class MainWindow(QMainWindow):
 
         if api_key and index_name:
             try:
-                pc = Pinecone(api_key=api_key)
-                index = pc.Index(index_name)
+                index = pinecone_index()
 
                 # Delete records from PDF namespace
                 if self.pdf_chat_widget.namespace_id:
-                    index.delete(delete_all=True, namespace=self.pdf_chat_widget.namespace_id)
+                    call_endpoint("pinecone", lambda: index.delete(delete_all=True, namespace=self.pdf_chat_widget.namespace_id))
 
                 # Delete records from DOCX namespace
                 if self.docx_chat_widget.namespace_id:
-                    index.delete(delete_all=True, namespace=self.docx_chat_widget.namespace_id)
+                    call_endpoint("pinecone", lambda: index.delete(delete_all=True, namespace=self.docx_chat_widget.namespace_id))
 
                 # Delete records from WEB namespace
                 if self.web_chat_widget.namespace_id:
-                    index.delete(delete_all=True, namespace=self.web_chat_widget.namespace_id)
+                    call_endpoint("pinecone", lambda: index.delete(delete_all=True, namespace=self.web_chat_widget.namespace_id))
 
                 print("Pinecone namespaces deleted successfully.")
             except Exception as e:
@@ -833,6 +2443,7 @@ class MainWindow(QMainWindow):
             print("Pinecone API key or index name not found in .env file.")
 
 if __name__ == "__main__":
+    threading.Thread(target=load_encoding, daemon=True).start()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
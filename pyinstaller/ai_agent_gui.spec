@@ -7,7 +7,7 @@ a = Analysis(
     pathex=[],
     binaries=[('your/path/to/python/lib', '.')],
     datas=[],
-    hiddenimports=['PySide6', 'PySide6.QtWidgets', 'PySide6.QtCore', 'PySide6.QtGui', 'langchain_experimental.agents.agent_toolkit', 'langchain_openai', 'langchain.agents.agent_types', 'pandas', 'pinecone', 'dotenv', 'requests', 'os', 'uuid', 'sys', 'matplotlib', 'tabulate'],
+    hiddenimports=['PySide6', 'PySide6.QtWidgets', 'PySide6.QtCore', 'PySide6.QtGui', 'langchain_experimental.agents.agent_toolkit', 'langchain_openai', 'langchain.agents.agent_types', 'langchain_core.callbacks', 'langchain_core.caches', 'langchain_experimental.tools.python.tool', 'pandas', 'pinecone', 'dotenv', 'requests', 'urllib3', 'urllib.parse', 'os', 'uuid', 'sys', 'hashlib', 'socket', 'threading', 'concurrent.futures', 'sqlite3', 'matplotlib', 'matplotlib.backends.backend_agg', 'tabulate', 'tiktoken'],
     hookspath=["."],
     hooksconfig={},
     runtime_hooks=[],